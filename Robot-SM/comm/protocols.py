@@ -1,15 +1,15 @@
 class RobotProtocol:
     """Class handling robot communication protocols."""
     
-    # BASE COMMANDS REQUESTS
-    CMD_BASE_MOVE_FORWARD   = bytearray([0x24, 0x24, 0x05, 0x04, 0x01, 0x52, 0x23, 0x23])
-    CMD_BASE_MOVE_BACKWARD  = bytearray([0x24, 0x24, 0x05, 0x04, 0x02, 0x53, 0x23, 0x23]) 
-    CMD_BASE_MOVE_STOP      = bytearray([0x24, 0x24, 0x05, 0x04, 0x03, 0x54, 0x23, 0x23])
-    CMD_BASE_TURN_90        = bytearray([0x24, 0x24, 0x05, 0x04, 0x04, 0x55, 0x23, 0x23])
-    CMD_BASE_READ_STATE     = bytearray([0x24, 0x24, 0x05, 0x03, 0x05, 0x55, 0x23, 0x23])
+    # BASE COMMANDS REQUESTS (bytes bất biến: gửi thẳng, không cần copy mỗi lần)
+    CMD_BASE_MOVE_FORWARD   = bytes([0x24, 0x24, 0x05, 0x04, 0x01, 0x52, 0x23, 0x23])
+    CMD_BASE_MOVE_BACKWARD  = bytes([0x24, 0x24, 0x05, 0x04, 0x02, 0x53, 0x23, 0x23])
+    CMD_BASE_MOVE_STOP      = bytes([0x24, 0x24, 0x05, 0x04, 0x03, 0x54, 0x23, 0x23])
+    CMD_BASE_TURN_90        = bytes([0x24, 0x24, 0x05, 0x04, 0x04, 0x55, 0x23, 0x23])
+    CMD_BASE_READ_STATE     = bytes([0x24, 0x24, 0x05, 0x03, 0x05, 0x55, 0x23, 0x23])
 
     # ARM COMMANDS REQUESTS
-    CMD_ARM_READ_STATE      = bytearray([0x24, 0x24, 0x06, 0x03, 0x51, 0x23, 0x23])
+    CMD_ARM_READ_STATE      = bytes([0x24, 0x24, 0x06, 0x03, 0x51, 0x23, 0x23])
 
     @staticmethod
     def build_pick_up_command(x: int, y: int) -> bytearray:
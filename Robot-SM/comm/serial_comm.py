@@ -2,6 +2,21 @@ import serial
 import time
 from typing import Optional
 
+try:
+    from .protocols import RobotProtocol  # type: ignore
+except ImportError:
+    from protocols import RobotProtocol  # type: ignore
+
+# Lệnh cố định (không tham số) → frame bytes dựng sẵn trong RobotProtocol
+_FIXED_COMMANDS = {
+    "base_forward": RobotProtocol.CMD_BASE_MOVE_FORWARD,
+    "base_backward": RobotProtocol.CMD_BASE_MOVE_BACKWARD,
+    "base_stop": RobotProtocol.CMD_BASE_MOVE_STOP,
+    "base_turn90": RobotProtocol.CMD_BASE_TURN_90,
+    "base_read_state": RobotProtocol.CMD_BASE_READ_STATE,
+    "arm_read_state": RobotProtocol.CMD_ARM_READ_STATE,
+}
+
 
 class SerialComm:
     def __init__(self, port: str, baudrate: int = 9600, timeout: float = 1.0):
@@ -41,40 +56,29 @@ class SerialComm:
         if not self.is_open():
             print("Connection is not open.")
             return 0
-        if isinstance(data, bytearray):
-            data = bytes(data)
         if not isinstance(data, (bytes, bytearray)):
             raise TypeError("send() expects bytes or bytearray")
         written = self.connection.write(data)
         return int(written)
 
-    def receive(self, size: Optional[int] = None, wait_time: float = 0.05) -> bytes:
+    def receive(self, size: Optional[int] = None) -> bytes:
         """Receive bytes from the serial port.
-        If size is None, read whatever is available after a short wait.
+        If size is None, block until the first byte arrives (up to the port timeout),
+        then return it together with everything already buffered.
         """
         if not self.is_open():
             print("Connection is not open.")
             return b""
 
         if size is None:
-            time.sleep(wait_time)
-            available = getattr(self.connection, "in_waiting", 0)
-            if available:
-                data = self.connection.read(available)
-                self._rx_buf.extend(data)
-                return bytes(data)
-            # fallback: try to read 1 byte within timeout
-            first = self.connection.read(1)
-            if not first:
+            data = self.connection.read(1)
+            if not data:
                 return b""
-            self._rx_buf.extend(first)
-            time.sleep(wait_time)
-            more = getattr(self.connection, "in_waiting", 0)
+            more = self.connection.in_waiting
             if more:
-                rest = self.connection.read(more)
-                self._rx_buf.extend(rest)
-                first += rest
-            return bytes(first)
+                data += self.connection.read(more)
+            self._rx_buf.extend(data)
+            return bytes(data)
         else:
             data = self.connection.read(size)
             self._rx_buf.extend(data)
@@ -95,48 +99,37 @@ class SerialComm:
         buf = self._rx_buf
         if len(buf) < 4:
             return None
-        # tìm header
-        try:
-            start = buf.index(0x24)
-            if start + 1 >= len(buf) or buf[start + 1] != 0x24:
-                # không đủ '$$' liên tiếp, bỏ byte đầu
-                del buf[: start + 1]
-                return None
-        except ValueError:
-            # không có '$' → xóa buffer
-            buf.clear()
+        # tìm header '$$' (bytearray.find chạy trong C, không lặp từng byte ở Python)
+        start = buf.find(b"$$")
+        if start < 0:
+            # không có header → bỏ rác, giữ lại '$' cuối (có thể là nửa header)
+            del buf[: len(buf) - 1 if buf.endswith(b"$") else len(buf)]
             return None
+        if start:
+            del buf[:start]
 
-        # tìm footer sau header
-        try:
-            end = buf.index(0x23, start + 2)
-            # cần 2 byte '##'
-            while end + 1 < len(buf) and buf[end + 1] != 0x23:
-                end = buf.index(0x23, end + 1)
-            if end + 1 >= len(buf):
-                return None  # chưa đủ '##'
-        except ValueError:
-            return None
+        # tìm footer '##' sau header
+        end = buf.find(b"##", 2)
+        if end < 0:
+            return None  # chưa đủ frame
 
-        frame = bytes(buf[start : end + 2])
+        frame = bytes(buf[: end + 2])
         # cắt buffer đến sau frame
         del buf[: end + 2]
         return frame
 
     def read_frame(self, timeout_s: float = 0.5) -> Optional[bytes]:
         """Đọc một frame hoàn chỉnh theo giao thức trong khoảng thời gian timeout."""
-        deadline = time.time() + timeout_s
-        while time.time() < deadline:
-            # cố gắng rút trích từ buffer hiện có
-            frame = self._try_extract_frame()
-            if frame:
-                return frame
+        deadline = time.monotonic() + timeout_s
+        # cố gắng rút trích từ buffer hiện có
+        frame = self._try_extract_frame()
+        while frame is None:
+            if time.monotonic() >= deadline:
+                return None
             # nếu chưa có, đọc thêm dữ liệu
             self.receive()
             frame = self._try_extract_frame()
-            if frame:
-                return frame
-        return None
+        return frame
 
     @staticmethod
     def _compute_crc(data: bytes) -> int:
@@ -186,7 +179,6 @@ class SerialComm:
             # payload: [moving_flag, obstacle_cm]
             if len(payload) >= 2:
                 info["moving"] = bool(payload[0])
-                print(f"Debug: Actor moving: {info['moving']}")
                 info["obstacle_cm"] = int(payload[1])
         elif src == 0x06 and typ == 0x04:  # Arm ACK
             # payload: 0xFF 0xFF
@@ -222,24 +214,10 @@ class SerialComm:
         Raises:
         - ValueError for invalid inputs
         """
-        try:
-            from .protocols import RobotProtocol  # type: ignore
-        except Exception:
-            from protocols import RobotProtocol  # type: ignore
-
         cmd = command
-        if cmd == "base_forward":
-            return bytes(RobotProtocol.CMD_BASE_MOVE_FORWARD)
-        if cmd == "base_backward":
-            return bytes(RobotProtocol.CMD_BASE_MOVE_BACKWARD)
-        if cmd == "base_stop":
-            return bytes(RobotProtocol.CMD_BASE_MOVE_STOP)
-        if cmd == "base_turn90":
-            return bytes(RobotProtocol.CMD_BASE_TURN_90)
-        if cmd == "base_read_state":
-            return bytes(RobotProtocol.CMD_BASE_READ_STATE)
-        if cmd == "arm_read_state":
-            return bytes(RobotProtocol.CMD_ARM_READ_STATE)
+        frame = _FIXED_COMMANDS.get(cmd)
+        if frame is not None:
+            return frame
         if cmd == "pickup":
             if x is None or y is None:
                 raise ValueError("pickup command requires x and y (in mm)")
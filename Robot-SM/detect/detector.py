@@ -7,11 +7,23 @@ from typing import Optional
 import cv2
 import numpy as np
 
+from .utils import should_quit
+
 try:
     from ultralytics import YOLO
 except ImportError:
     raise ImportError("Ultralytics package is required. Install with `pip install ultralytics`.")
 
+# Hằng số vẽ overlay (màu BGR, font), dựng một lần thay vì tạo lại mỗi khung hình
+_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_BOX_COLOR = (0, 255, 0)
+_FPS_COLOR = (50, 220, 50)
+_STATE_COLOR = (0, 0, 255)
+_DIST_COLOR = (255, 200, 0)
+_EGGS_COLOR = (0, 200, 255)
+_GUIDE_COLOR = (0, 0, 255)
+DISPLAY_MAX_FPS = 30.0  # tần số imshow tối đa; khung nhiều hơn vẫn được xử lý nhưng không hiển thị
+
 
 class YoloRunner:
     """Chạy YOLO trên khung hình lấy từ frame_queue và hiển thị kết quả.
@@ -22,7 +34,7 @@ class YoloRunner:
     - window_name: tên cửa sổ hiển thị
     - on_detections: callback(list[dict]) nhận danh sách phát hiện mỗi khung hình
     - status_provider: callable() -> str, trả về trạng thái hiện tại để overlay lên khung hình
-    - info_provider: callable() -> dict, trả về thông tin bổ sung để overlay (ví dụ {'dist': cm, 'eggs': n})
+    - info_provider: callable() -> dict, trả về thông tin bổ sung để overlay (ví dụ {'dist': cm}); số trứng lấy từ khung hình hiện tại
     - yolo_params: dict các tham số (imgsz, conf, iou, device, max_det, half)
     """
 
@@ -62,12 +74,15 @@ class YoloRunner:
         self._info_provider = info_provider
         self._params = yolo_params
         self._fps_avg: Optional[float] = None
+        self._last_detections_ts = float("-inf")  # time.perf_counter() lần gọi on_detections gần nhất
 
     def process_once(self, frame: np.ndarray) -> np.ndarray:
         t0 = time.perf_counter()
         results = self._model.predict(source=frame, verbose=False, **self._params)
         result = results[0]
-        canvas = result.plot()
+        # Khi lọc theo class_name thì tự vẽ các bbox đã lọc thẳng lên frame (frame lấy từ queue
+        # thuộc về ta, không ai dùng lại) → bỏ qua result.plot() và không cần copy ảnh
+        canvas = result.plot() if self._class_name is None else frame
 
         # Chuẩn bị danh sách phát hiện dạng chuẩn cho FSM
         det_list = []
@@ -77,52 +92,50 @@ class YoloRunner:
             confs = boxes.conf.cpu().numpy()
             classes = boxes.cls.cpu().numpy().astype(int)
             h, w = frame.shape[:2]
-            for (x1, y1, x2, y2), conf, cls_id in zip(xyxy, confs, classes):
-                if isinstance(self._names, dict):
-                    label = self._names.get(cls_id, f"class_{cls_id}")
-                else:
-                    label = str(cls_id)
+            # Tính tâm và tọa độ chuẩn hóa cho mọi bbox cùng lúc bằng NumPy,
+            # rồi tolist() một lần để vòng lặp chỉ làm việc với float/int Python
+            centers = (xyxy[:, :2] + xyxy[:, 2:]) / 2.0
+            norms = centers / np.array((max(1.0, w), max(1.0, h)))
+            names = self._names if isinstance(self._names, dict) else None
+            for bbox, conf, cls_id, (cx, cy), (x_norm, y_norm) in zip(
+                    xyxy.tolist(), confs.tolist(), classes.tolist(), centers.tolist(), norms.tolist()):
+                label = names.get(cls_id, f"class_{cls_id}") if names is not None else str(cls_id)
                 # Lọc theo class_name nếu chỉ định
                 if self._class_name is not None and label != self._class_name:
                     continue
-                cx = (x1 + x2) / 2.0
-                cy = (y1 + y2) / 2.0
                 det_list.append({
                     "label": label,
-                    "conf": float(conf),
-                    "bbox": [float(x1), float(y1), float(x2), float(y2)],
-                    "x_px": float(cx),
-                    "y_px": float(cy),
-                    "x_norm": float(cx / max(1.0, w)),
-                    "y_norm": float(cy / max(1.0, h)),
+                    "conf": conf,
+                    "bbox": bbox,
+                    "x_px": cx,
+                    "y_px": cy,
+                    "x_norm": x_norm,
+                    "y_norm": y_norm,
                 })
 
         # Nếu có callback detections, gọi để phát sự kiện cho FSM
         if (self._on_detections is not None):
-            now = time.time()
-            last = getattr(self, "_last_detections_ts", 0.0)
-            if now - last >= 1.0:
+            # Dùng lại mốc t0 đầu khung hình, không đọc đồng hồ thêm lần nữa
+            if t0 - self._last_detections_ts >= 1.0:
                 try:
-                    self._last_detections_ts = now
+                    self._last_detections_ts = t0
                     self._on_detections(det_list)
 
                 except Exception:
                     pass
 
-        # Vẽ lại nếu cần lọc theo class_name
-        if self._class_name is not None and hasattr(result, "boxes") and result.boxes is not None:
-            filtered = canvas.copy()
+        # Vẽ các bbox đã lọc theo class_name (vẽ trực tiếp lên canvas)
+        if self._class_name is not None:
             for det in det_list:
                 x1, y1, x2, y2 = det["bbox"]
                 label = det["label"]
                 conf = det["conf"]
-                cv2.rectangle(filtered, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                cv2.putText(filtered, f"{label} {conf:.2f}", (int(x1), max(0, int(y1) - 5)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2, cv2.LINE_AA)
-            canvas = filtered
+                cv2.rectangle(canvas, (int(x1), int(y1)), (int(x2), int(y2)), _BOX_COLOR, 2)
+                cv2.putText(canvas, f"{label} {conf:.2f}", (int(x1), max(0, int(y1) - 5)), _FONT, 0.6, _BOX_COLOR, 2, cv2.LINE_AA)
 
         # Overlay trạng thái FSM nếu có
         y = 30
-        cv2.putText(canvas, f"FPS: {self._fps_avg:.1f}" if self._fps_avg is not None else "FPS: --", (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (50, 220, 50), 2, cv2.LINE_AA)
+        cv2.putText(canvas, f"FPS: {self._fps_avg:.1f}" if self._fps_avg is not None else "FPS: --", (10, y), _FONT, 0.6, _FPS_COLOR, 2, cv2.LINE_AA)
         y += 30
         if self._status_provider is not None:
             try:
@@ -130,7 +143,7 @@ class YoloRunner:
             except Exception:
                 status = ""
             if status:
-                cv2.putText(canvas, f"State: {status}", (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2, cv2.LINE_AA)
+                cv2.putText(canvas, f"State: {status}", (10, y), _FONT, 0.6, _STATE_COLOR, 2, cv2.LINE_AA)
                 y += 30
         if self._info_provider is not None:
             try:
@@ -140,10 +153,10 @@ class YoloRunner:
             dist = info.get("dist")
             eggs = len(det_list)
             if dist is not None:
-                cv2.putText(canvas, f"Dist: {dist} cm", (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 200, 0), 2, cv2.LINE_AA)
+                cv2.putText(canvas, f"Dist: {dist} cm", (10, y), _FONT, 0.6, _DIST_COLOR, 2, cv2.LINE_AA)
                 y += 30
             if eggs is not None:
-                cv2.putText(canvas, f"Eggs: {eggs}", (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 200, 255), 2, cv2.LINE_AA)
+                cv2.putText(canvas, f"Eggs: {eggs}", (10, y), _FONT, 0.6, _EGGS_COLOR, 2, cv2.LINE_AA)
                 y += 30
 
         dt = time.perf_counter() - t0
@@ -155,22 +168,31 @@ class YoloRunner:
             y_line = int(0.25 * h)
             x_left = int(0.05 * w)
             x_right = int(0.95 * w)
-            cv2.line(canvas, (x_left, y_line), (x_right, y_line), (0, 0, 255), 1)
-            cv2.line(canvas, (x_left, y_line), (x_left, h - 1), (0, 0, 255), 1)
-            cv2.line(canvas, (x_right, y_line), (x_right, h - 1), (0, 0, 255), 1)
+            cv2.line(canvas, (x_left, y_line), (x_right, y_line), _GUIDE_COLOR, 1)
+            cv2.line(canvas, (x_left, y_line), (x_left, h - 1), _GUIDE_COLOR, 1)
+            cv2.line(canvas, (x_right, y_line), (x_right, h - 1), _GUIDE_COLOR, 1)
         except Exception:
             pass
         return canvas
 
     def run_loop(self, frame_queue: "queue.Queue[np.ndarray]") -> None:
+        min_show_dt = 1.0 / DISPLAY_MAX_FPS
+        last_show = float("-inf")
         while True:
             try:
                 frame = frame_queue.get(timeout=1.0)
             except queue.Empty:
                 continue
             canvas = self.process_once(frame)
-            cv2.imshow(self._window, canvas)
-            key = cv2.waitKey(1) & 0xFF
-            if key in (27, ord("q"), ord("Q")):
+            # Chỉ imshow + waitKey(1) khi đủ 1/DISPLAY_MAX_FPS giây kể từ lần hiển thị trước;
+            # frame bị bỏ qua thì dùng pollKey() để nhận phím thoát mà không chặn 1 ms
+            now = time.monotonic()
+            if now - last_show >= min_show_dt:
+                cv2.imshow(self._window, canvas)
+                last_show = now
+                key = cv2.waitKey(1) & 0xFF
+            else:
+                key = cv2.pollKey() & 0xFF
+            if should_quit(key):
                 break
         cv2.destroyAllWindows()
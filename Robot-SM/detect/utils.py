@@ -5,6 +5,9 @@ from typing import Union
 import cv2
 import numpy as np
 
+# Phím thoát cửa sổ hiển thị: ESC, q, Q
+QUIT_KEYS = frozenset((27, ord("q"), ord("Q")))
+
 
 def open_source(source: str, is_image: bool) -> Union[int, str, np.ndarray]:
     """Chuẩn hóa nguồn vào:
@@ -23,4 +26,4 @@ def open_source(source: str, is_image: bool) -> Union[int, str, np.ndarray]:
 
 
 def should_quit(key: int) -> bool:
-    return key in (27, ord("q"), ord("Q"))
+    return key in QUIT_KEYS
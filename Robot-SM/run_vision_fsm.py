@@ -9,10 +9,11 @@ Cách chạy:
 from __future__ import annotations
 
 import argparse
+import atexit
 import queue
 import threading
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from typing import Optional
 
 import numpy as np
@@ -26,15 +27,29 @@ from .detect.utils import open_source
 from .detect.capture import CaptureWorker
 
 
+_log_listener: Optional[QueueListener] = None
+
+
 def setup_logging(log_file: str = "robot_sm.log", console_level: int = logging.INFO, file_level: int = logging.DEBUG) -> logging.Logger:
-    """Configure logging to both console and rotating file."""
+    """Configure logging to both console and rotating file.
+
+    Records are only enqueued on the calling thread (FSM, timers, polling);
+    a QueueListener thread writes them to the console/file handlers.
+    """
+    global _log_listener
     logger = logging.getLogger("robot_sm")
-    logger.setLevel(logging.DEBUG)
+    # Mức của logger = mức thấp nhất mà một handler còn ghi: debug() bị bỏ ngay ở
+    # isEnabledFor (không tạo LogRecord/đưa vào queue) khi không handler nào cần
+    level = min(console_level, file_level)
+    logger.setLevel(level)
     logger.propagate = False
 
     # Clear existing handlers to avoid duplicates on repeated runs
     for h in list(logger.handlers):
         logger.removeHandler(h)
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
 
     fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
 
@@ -42,19 +57,32 @@ def setup_logging(log_file: str = "robot_sm.log", console_level: int = logging.I
     ch = logging.StreamHandler()
     ch.setLevel(console_level)
     ch.setFormatter(fmt)
-    logger.addHandler(ch)
 
-    # Rotating file handler
-    fh = RotatingFileHandler(log_file, maxBytes=2 * 1024 * 1024, backupCount=3, encoding="utf-8")
+    # Rotating file handler (delay=True: chỉ mở file khi có bản ghi đầu tiên)
+    fh = RotatingFileHandler(log_file, maxBytes=2 * 1024 * 1024, backupCount=3, encoding="utf-8", delay=True)
     fh.setLevel(file_level)
     fh.setFormatter(fmt)
-    logger.addHandler(fh)
+
+    # Ghi log qua hàng đợi: luồng gọi chỉ put record, listener ghi ra console/file
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, ch, fh, respect_handler_level=True)
+    _log_listener.start()
 
     # Also set lower level for sub-loggers
-    logging.getLogger("robot_sm.context").setLevel(logging.DEBUG)
+    logging.getLogger("robot_sm.context").setLevel(level)
     return logger
 
 
+@atexit.register
+def _stop_logging() -> None:
+    """Flush the queued log records when the process exits."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+
 def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Run FSM + YOLO unified runner")
     parser.add_argument("--config", type=str, default="Robot-SM/config/app.yaml", help="Path to app config YAML")
@@ -91,7 +119,7 @@ def main(argv: Optional[list[str]] = None) -> int:
     ctx = RobotContext(controller=fsm, logger=app_logger, port=port, baudrate=baudrate)
     # Pass pick thresholds to context for decision in states
     fsm.ctx = ctx
-    fsm.ctx.pick_thresholds = cfg.get("fsm", {}).get("pick_thresholds", {})
+    fsm.ctx.pick_thresholds = cfg.get("fsm", {}).get("pick_thresholds") or {}
 
     # Vision params
     vision_cfg = cfg.get("vision", {})
@@ -137,10 +165,8 @@ def main(argv: Optional[list[str]] = None) -> int:
             window_name='YOLO + FSM',
             on_detections=on_detections,
             status_provider=status_provider,
-            info_provider=lambda: {
-                "dist": getattr(ctx, "obstacle_cm", None),
-                "eggs": (len(getattr(ctx, "last_detections", [])) if isinstance(getattr(ctx, "last_detections", None), list) else None),
-            },
+            # Số trứng overlay lấy từ det_list của chính khung hình, chỉ cần dist
+            info_provider=lambda: {"dist": ctx.obstacle_cm},
 
             imgsz=640,
             conf=0.25,
@@ -4,7 +4,8 @@ Context tối thiểu để chạy FSM trong states.py cùng với StateControll
 Chức năng:
 - Cung cấp logger và các API mà states.Context mong đợi.
 - Mô phỏng hành vi thiết bị: các lệnh cmd_* chỉ ghi log và trả về True.
-- Hỗ trợ timer: start_timer/cancel_timer phát Event("timer", payload=name) về StateController.
+- Hỗ trợ timer: start_timer/cancel_timer phát Event("timer", payload=TimerId) về StateController
+  (một thread điều phối dùng chung cho mọi timer).
 - Hỗ trợ polling tối giản: set_polling("base_state"|"arm_state", True/False, interval)
   sẽ phát định kỳ Event tương ứng để FSM có thể chuyển trạng thái khi demo.
 
@@ -14,17 +15,20 @@ Ghi chú:
 """
 from __future__ import annotations
 
+import heapq
+import itertools
 import logging
 import threading
 import time
-from typing import Optional, Dict, Callable
+from typing import Optional, Dict, Callable, List, Tuple
 
 from .controller import StateController, Event
+from .states import MotionState, TimerId, pick_window, scara_affine
 from ..comm.serial_comm import SerialComm
 
 
 def _to_hex(b: bytes) -> str:
-    return " ".join(f"{x:02X}" for x in b)
+    return b.hex(" ").upper()
 
 
 class RobotContext:
@@ -44,10 +48,19 @@ class RobotContext:
         # Trạng thái gần nhất để overlay
         self.last_base_state: Optional[str] = "unknown"
         self.last_arm_state: Optional[str] = "unknown"
+        # Cấu hình cho các state (ngưỡng pick, thông số SCARA), mặc định rỗng
+        self.pick_thresholds = {}
+        self.scara = {}
         # Serial
         self.comm = SerialComm(port, baudrate)
         # Quản lý timers và polling
-        self._timers: Dict[str, threading.Timer] = {}
+        # Timer: một thread điều phối duy nhất chờ trên heap (deadline, seq, name);
+        # _timers giữ seq hiện hành của mỗi TimerId, entry lệch seq coi như đã hủy
+        self._timer_cond = threading.Condition()
+        self._timer_heap: List[Tuple[float, int, TimerId]] = []
+        self._timers: Dict[TimerId, int] = {}
+        self._timer_seq = itertools.count()
+        self._timer_thread: Optional[threading.Thread] = None
         self._pollers: Dict[str, threading.Event] = {}
         self._arm_busy_counts: int = 0  # mô phỏng arm bận vài lần trước khi done
 
@@ -56,18 +69,42 @@ class RobotContext:
     def logger(self) -> logging.Logger:
         return self._logger
 
+    # ---- Config ----
+    @property
+    def pick_thresholds(self) -> dict:
+        return self._pick_thresholds
+
+    @pick_thresholds.setter
+    def pick_thresholds(self, value: dict) -> None:
+        # Dựng sẵn vùng chọn trứng mỗi khi đổi cấu hình
+        self._pick_thresholds = value
+        self.pick_window = pick_window(value)
+
+    @property
+    def scara(self) -> dict:
+        return self._scara
+
+    @scara.setter
+    def scara(self, value: dict) -> None:
+        # Dựng sẵn hệ số pixel → mm mỗi khi đổi cấu hình
+        self._scara = value
+        self.scara_affine = scara_affine(value)
+
     # ---- Serial command helpers ----
     def _send_command(self, command: str, **kwargs) -> bool:
         try:
             payload = SerialComm.build_command(command, **kwargs)
-            self.logger.info("SEND %s: %s", command, _to_hex(payload))
+            # _to_hex chỉ chạy khi log INFO thực sự được ghi
+            log_info = self.logger.isEnabledFor(logging.INFO)
+            if log_info:
+                self.logger.info("SEND %s: %s", command, _to_hex(payload))
             written = self.comm.send(payload)
             if written <= 0:
                 self.logger.error("WRITE FAILED: %s", command)
                 return False
             # Đọc nhanh phản hồi (nếu có)
             resp = self.comm.receive()
-            if resp:
+            if resp and log_info:
                 self.logger.info("RESP %s (%d bytes): %s", command, len(resp), _to_hex(resp))
             return True
         except Exception as e:
@@ -98,21 +135,52 @@ class RobotContext:
         return self._send_command("arm_read_state")
 
     # ---- Timers ----
-    def start_timer(self, name: str, seconds: float) -> None:
+    def start_timer(self, name: TimerId, seconds: float) -> None:
         self.cancel_timer(name)
-        def fire():
-            self.logger.debug("TIMER FIRED: %s", name)
-            self._controller.dispatch(Event(type="timer", payload=name))
-        t = threading.Timer(seconds, fire)
-        self._timers[name] = t
-        t.start()
-        self.logger.debug("TIMER START: %s (%.2fs)", name, seconds)
-
-    def cancel_timer(self, name: str) -> None:
-        t = self._timers.pop(name, None)
-        if t is not None:
-            t.cancel()
-            self.logger.debug("TIMER CANCEL: %s", name)
+        with self._timer_cond:
+            seq = next(self._timer_seq)
+            self._timers[name] = seq
+            heapq.heappush(self._timer_heap, (time.monotonic() + seconds, seq, name))
+            if self._timer_thread is None:
+                self._timer_thread = threading.Thread(target=self._timer_loop, name="timers", daemon=True)
+                self._timer_thread.start()
+            self._timer_cond.notify()
+        self.logger.debug("TIMER START: %s (%.2fs)", name.name, seconds)
+
+    def cancel_timer(self, name: TimerId) -> None:
+        with self._timer_cond:
+            # Entry trong heap được bỏ qua khi tới hạn vì không còn khớp seq
+            seq = self._timers.pop(name, None)
+        if seq is not None:
+            self.logger.debug("TIMER CANCEL: %s", name.name)
+
+    def _timer_loop(self) -> None:
+        """Thread điều phối timer: chờ tới deadline sớm nhất rồi phát Event("timer")."""
+        heap = self._timer_heap
+        while True:
+            with self._timer_cond:
+                while True:
+                    if not heap:
+                        self._timer_cond.wait()
+                        continue
+                    deadline, seq, name = heap[0]
+                    if self._timers.get(name) != seq:
+                        heapq.heappop(heap)  # đã hủy hoặc đã đặt lại
+                        continue
+                    delay = deadline - time.monotonic()
+                    if delay > 0:
+                        self._timer_cond.wait(delay)
+                        continue
+                    heapq.heappop(heap)
+                    del self._timers[name]
+                    break
+            # Dispatch ngoài lock: state mới có thể start/cancel timer trong enter/exit
+            self.logger.debug("TIMER FIRED: %s", name.name)
+            try:
+                self._controller.dispatch(Event(type="timer", payload=name))
+            except Exception:
+                # Giữ thread điều phối sống cho các timer khác (controller đã log chi tiết)
+                self.logger.exception("TIMER DISPATCH ERROR: %s", name.name)
 
     # ---- Polling ----
     def set_polling(self, topic: str, enable: bool, interval_s: float = 1.0) -> None:
@@ -125,50 +193,52 @@ class RobotContext:
         if not enable:
             return
 
-        stop_evt = threading.Event()
-        self._pollers[key] = stop_evt
-
-        def loop_base_state():
-            self.logger.debug("POLL START: base_state every %.2fs", interval_s)
-            while not stop_evt.is_set():
-                if self.cmd_base_read_state():
-                    parsed = self.comm.read_parsed(timeout_s=1)
-                    if parsed and parsed.get("source") == "actor" and parsed.get("type") == "state":
-                        moving = bool(parsed.get("moving", False))
-                        print(f"Debug: moving: {moving}")
-                        self.obstacle_cm = parsed.get("obstacle_cm", None)
-                        self._controller.dispatch(Event(type="obstacle_dist", payload=self.obstacle_cm))
-                        
-                        payload = "turning" if moving else "stopped"
-                        print("Parsed base state:", payload)
-                        # Lưu trạng thái actor/base gần nhất
-                        self.last_base_state = payload
-                        self._controller.dispatch(Event(type="base_state", payload=payload))
-                stop_evt.wait(interval_s)
-
-        def loop_arm_state():
-            self.logger.debug("POLL START: arm_state every %.2fs", interval_s)
-            while not stop_evt.is_set():
-                if self.cmd_arm_read_state():
-                    parsed = self.comm.read_parsed(timeout_s=1)
-                    if parsed and parsed.get("source") == "arm" and parsed.get("type") == "state":
-                        busy = bool(parsed.get("arm_busy", False))
-                        # Lưu trạng thái arm gần nhất
-                        self.last_arm_state = "busy" if busy else "done"
-                        self._controller.dispatch(Event(type="arm_state", payload=self.last_arm_state))
-                stop_evt.wait(interval_s)
-
-        loops: Dict[str, Callable[[], None]] = {
-            "base_state": loop_base_state,
-            "arm_state": loop_arm_state,
-        }
-        loop_fn = loops.get(topic)
+        loop_fn = self._POLL_LOOPS.get(topic)
         if loop_fn is None:
             self.logger.warning("POLL UNKNOWN TOPIC: %s (ignored)", topic)
             return
 
-        th = threading.Thread(target=loop_fn, name=key, daemon=True)
+        stop_evt = threading.Event()
+        self._pollers[key] = stop_evt
+        th = threading.Thread(target=loop_fn, args=(self, stop_evt, interval_s), name=key, daemon=True)
         th.start()
 
+    def _loop_base_state(self, stop_evt: threading.Event, interval_s: float) -> None:
+        self.logger.debug("POLL START: base_state every %.2fs", interval_s)
+        while not stop_evt.is_set():
+            if self.cmd_base_read_state():
+                parsed = self.comm.read_parsed(timeout_s=1)
+                if parsed and parsed.get("source") == "actor" and parsed.get("type") == "state":
+                    moving = bool(parsed.get("moving", False))
+                    self.obstacle_cm = parsed.get("obstacle_cm", None)
+                    self._controller.dispatch(Event(type="obstacle_dist", payload=self.obstacle_cm))
+
+                    payload = "turning" if moving else "stopped"
+                    self.logger.debug("Parsed base state: %s", payload)
+                    # Lưu trạng thái actor/base gần nhất
+                    self.last_base_state = payload
+                    state = MotionState.MOVING if moving else MotionState.STOPPED
+                    self._controller.dispatch(Event(type="base_state", payload=state))
+            stop_evt.wait(interval_s)
+
+    def _loop_arm_state(self, stop_evt: threading.Event, interval_s: float) -> None:
+        self.logger.debug("POLL START: arm_state every %.2fs", interval_s)
+        while not stop_evt.is_set():
+            if self.cmd_arm_read_state():
+                parsed = self.comm.read_parsed(timeout_s=1)
+                if parsed and parsed.get("source") == "arm" and parsed.get("type") == "state":
+                    busy = bool(parsed.get("arm_busy", False))
+                    # Lưu trạng thái arm gần nhất
+                    self.last_arm_state = "busy" if busy else "done"
+                    state = MotionState.MOVING if busy else MotionState.STOPPED
+                    self._controller.dispatch(Event(type="arm_state", payload=state))
+            stop_evt.wait(interval_s)
+
+    # topic -> hàm vòng polling (định nghĩa một lần, không tạo closure mỗi lần set_polling)
+    _POLL_LOOPS: Dict[str, Callable[["RobotContext", threading.Event, float], None]] = {
+        "base_state": _loop_base_state,
+        "arm_state": _loop_arm_state,
+    }
+
     def update_detections(self, det_list: list[dict]) -> None:
         self.last_detections = det_list
@@ -14,6 +14,7 @@ Ngữ cảnh sử dụng:
 """
 from __future__ import annotations
 
+import logging
 from dataclasses import dataclass
 from typing import Optional, Any
 
@@ -59,20 +60,26 @@ class StateController:
         if self.current_state is None:
             raise RuntimeError("FSM not started. Call start(initial_state) first.")
 
-        # Chuẩn hóa event
-        ev = event if hasattr(event, "type") and hasattr(event, "payload") else Event(type=str(event), payload=None)
-        self._log_event(ev)
+        # Chuẩn hóa event (Event là trường hợp phổ biến → kiểm tra type trước, bỏ qua hasattr)
+        if type(event) is Event or (hasattr(event, "type") and hasattr(event, "payload")):
+            ev = event
+        else:
+            ev = Event(type=str(event), payload=None)
+        logger = getattr(self.ctx, "logger", None)
+        if logger and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("FSM EVENT: %s payload=%s", ev.type, ev.payload)
 
         # Cho state xử lý
+        state = self.current_state
         try:
-            next_state = self.current_state.handle(self.ctx, ev)
+            next_state = state.handle(self.ctx, ev)
         except Exception:
             # Đảm bảo lỗi trong handle không phá hỏng controller; log và giữ nguyên state
             self._log_error("HANDLE_ERROR", ev)
             raise
 
         # Nếu state yêu cầu chuyển
-        if next_state and next_state is not self.current_state:
+        if next_state is not None and next_state is not state:
             self._transition(next_state)
 
     def _transition(self, next_state: sm_states.BaseState) -> None:
@@ -98,11 +105,6 @@ class StateController:
         if logger:
             logger.info("FSM %s: %s", action, getattr(state, "id", state.__class__.__name__))
 
-    def _log_event(self, ev: Event) -> None:
-        logger = getattr(self.ctx, "logger", None)
-        if logger:
-            logger.debug("FSM EVENT: %s payload=%s", ev.type, getattr(ev, "payload", None))
-
     def _log_error(self, where: str, ev: Event) -> None:
         logger = getattr(self.ctx, "logger", None)
         if logger:
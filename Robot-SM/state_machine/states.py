@@ -19,7 +19,9 @@ Ngữ cảnh sử dụng:
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, Optional, Protocol
+from enum import IntEnum
+from operator import methodcaller
+from typing import Any, Callable, Optional, Protocol, Tuple
 
 
 class Event(Protocol):
@@ -37,6 +39,37 @@ class Event(Protocol):
     payload: Any
 
 
+class TimerId(IntEnum):
+    """Định danh các timer của FSM (payload của event 'timer').
+
+    So sánh bằng `is` trên các member IntEnum thay vì so chuỗi tên timer.
+    """
+
+    TURN1_TIMEOUT = 1
+    NO_EGG_TIMEOUT = 2
+    MOVE_DURATION = 3
+    TURN2_TIMEOUT = 4
+
+    def __str__(self) -> str:
+        # Log "%s" in ra tên như chuỗi cũ ("turn1_timeout"), không phải số
+        return self.name.lower()
+
+
+class MotionState(IntEnum):
+    """Payload của event 'base_state' và 'arm_state'.
+
+    Giá trị trùng với cờ byte4 trong phản hồi trạng thái (docs/protocols.md):
+    0x00 = base đứng yên / arm ở vị trí chờ, 0x01 = đang chuyển động.
+    """
+
+    STOPPED = 0
+    MOVING = 1
+
+    def __str__(self) -> str:
+        # Log "%s" in ra "stopped"/"moving" như trước, không phải 0/1
+        return self.name.lower()
+
+
 class Context(Protocol):
     """Giao diện Context mong đợi (tham chiếu đến context.py).
 
@@ -64,33 +97,103 @@ class Context(Protocol):
     last_detections: list
     obstacle_cm: Optional[float]
 
+    # Configuration (luôn có, mặc định là dict rỗng)
+    pick_thresholds: dict
+    # (y_min, x_min, x_max) dựng sẵn từ pick_thresholds, xem pick_window()
+    pick_window: Tuple[float, float, float]
+    scara: dict
+    # (sx, sy, dx, dy) dựng sẵn từ scara, xem scara_affine()
+    scara_affine: Tuple[float, float, float, float]
+
     # Timers/scheduler
-    def start_timer(self, name: str, seconds: float) -> None: ...
-    def cancel_timer(self, name: str) -> None: ...
+    def start_timer(self, name: TimerId, seconds: float) -> None: ...
+    def cancel_timer(self, name: TimerId) -> None: ...
 
     # Utility
     def set_polling(self, topic: str, enable: bool, interval_s: float = 1.0) -> None: ...
 
 
+def pick_window(th: dict) -> Tuple[float, float, float]:
+    """Dựng vùng chọn trứng (y_min, x_min, x_max) theo tọa độ chuẩn hóa từ cấu hình.
+
+    Chức năng: Ép kiểu và gán mặc định một lần thay vì mỗi event eggs_detected.
+    Ngữ cảnh: Context gọi khi gán pick_thresholds; ScanAndMoveState chỉ đọc tuple kết quả.
+    """
+    return (
+        float(th.get("y_min_norm", 0.25)),
+        float(th.get("x_min_norm", 0.05)),
+        float(th.get("x_max_norm", 0.95)),
+    )
+
+
+def scara_affine(scara: dict) -> Tuple[float, float, float, float]:
+    """Dựng hệ số đổi pixel → mm (sx, sy, dx, dy) từ cấu hình SCARA.
+
+    Chức năng: Tính một lần x_mm = sx * x_px + dx, y_mm = sy * y_px + dy.
+    Ngữ cảnh: Context gọi khi gán cấu hình scara; PickUpEggState chỉ đọc tuple kết quả.
+    """
+    height_px = float(scara.get("height_px", 480))
+    width_px = float(scara.get("width_px", 640))
+    height_mm = float(scara.get("height_mm", 240))
+    width_mm = float(scara.get("width_mm", 320))
+    dx = float(scara.get("dx", 100))
+    dy = float(scara.get("dy", 50))
+    return (width_mm / width_px, height_mm / height_px, dx, dy)
+
+
+@dataclass(frozen=True)
+class StateSpec:
+    """Mô tả khai báo tài nguyên enter/exit của một state.
+
+    Chức năng:
+    - on_enter: các lệnh gọi lên ctx khi vào state (ví dụ methodcaller("cmd_base_forward")).
+    - pollings: các cặp (topic, interval_s) bật khi enter, tắt khi exit.
+    - timers: các cặp (name, seconds) đặt khi enter, hủy khi exit.
+
+    Ngữ cảnh sử dụng:
+    - Mỗi state khai báo SPEC một lần; BaseState.enter/exit duyệt SPEC thay vì
+      lặp lại cùng một đoạn set_polling/start_timer ở từng state.
+    """
+
+    on_enter: Tuple[Callable[[Context], Any], ...] = ()
+    pollings: Tuple[Tuple[str, float], ...] = ()
+    timers: Tuple[Tuple[TimerId, float], ...] = ()
+
+
 class BaseState:
     """Lớp cơ sở cho mọi trạng thái.
 
     Chức năng:
     - Định nghĩa khung enter/handle/exit và logging mặc định.
+    - Áp dụng SPEC: gửi lệnh on_enter, bật polling, đặt timer khi enter; dọn dẹp khi exit.
 
     Ngữ cảnh sử dụng:
     - Các state cụ thể kế thừa để cài đặt logic riêng.
     - Controller gọi enter/handle/exit tương ứng.
     """
+    __slots__ = ()
+
     id: str = "base"
+    SPEC: StateSpec = StateSpec()
 
     def enter(self, ctx: Context) -> None:
         """Hook khi vào trạng thái.
 
-        Chức năng: Khởi tạo tài nguyên cho state (ví dụ: bật polling/timer, gửi lệnh ban đầu).
+        Chức năng: Khởi tạo tài nguyên cho state theo SPEC (gửi lệnh ban đầu, bật polling/timer).
         Ngữ cảnh: Được Controller gọi ngay sau khi state trở thành current_state.
         """
         ctx.logger.debug("Enter: %s", self.id)
+        self._apply_spec(ctx)
+
+    def _apply_spec(self, ctx: Context) -> None:
+        """Chạy on_enter, bật polling và đặt timer theo SPEC (không log)."""
+        spec = self.SPEC
+        for fn in spec.on_enter:
+            fn(ctx)
+        for topic, interval_s in spec.pollings:
+            ctx.set_polling(topic, True, interval_s=interval_s)
+        for name, seconds in spec.timers:
+            ctx.start_timer(name, seconds)
 
     def handle(self, ctx: Context, event: Event) -> Optional[BaseState]:
         """Xử lý một sự kiện.
@@ -104,9 +207,14 @@ class BaseState:
     def exit(self, ctx: Context) -> None:
         """Hook khi rời trạng thái.
 
-        Chức năng: Dọn tài nguyên do state thiết lập (tắt polling, hủy timer...).
+        Chức năng: Dọn tài nguyên do state thiết lập theo SPEC (hủy timer, tắt polling).
         Ngữ cảnh: Được Controller gọi trước khi chuyển sang state mới.
         """
+        spec = self.SPEC
+        for name, _ in spec.timers:
+            ctx.cancel_timer(name)
+        for topic, _ in spec.pollings:
+            ctx.set_polling(topic, False)
         ctx.logger.debug("Exit: %s", self.id)
 
 
@@ -137,12 +245,11 @@ class ScanAndMoveState(BaseState):
     Ngữ cảnh: Sau khi start hoặc sau một vòng quay/dò.
     """
     id = "ScanAndMove"
-
-    def enter(self, ctx: Context) -> None:
-        """Gửi lệnh tiến, bật polling trạng thái base mỗi 1s."""
-        super().enter(ctx)
-        ctx.cmd_base_forward()
-        ctx.set_polling("base_state", True, interval_s=1.0)
+    # Gửi lệnh tiến, bật polling trạng thái base mỗi 1s
+    SPEC = StateSpec(
+        on_enter=(methodcaller("cmd_base_forward"),),
+        pollings=(("base_state", 1.0),),
+    )
 
     def handle(self, ctx: Context, event: Event) -> Optional[BaseState]:
         """Khi phát hiện trứng ở vùng giữa → dừng và sang PickUpEgg.
@@ -152,15 +259,12 @@ class ScanAndMoveState(BaseState):
             eggs = event.payload or []
             ctx.last_detections = eggs
             # Điều kiện chọn ứng viên theo ngưỡng cấu hình từ context
-            th = getattr(ctx, "pick_thresholds", {}) or {}
-            y_min = float(th.get("y_min_norm", 0.25))
-            x_min = float(th.get("x_min_norm", 0.05))
-            x_max = float(th.get("x_max_norm", 0.95))
+            y_min, x_min, x_max = ctx.pick_window
             candidates = [
                 e for e in eggs
                 if (e.get("y_norm", 0.0) > y_min) and (x_min < e.get("x_norm", 0.0) < x_max)
             ]
-            print(f"candidates: {candidates}")
+            ctx.logger.debug("candidates: %s", candidates)
             if candidates:
                 ctx.cmd_base_stop()
                 return PickUpEggState(target=candidates[0])
@@ -171,94 +275,71 @@ class ScanAndMoveState(BaseState):
             return TurnFirstState()
         return super().handle(ctx, event)
 
-    def exit(self, ctx: Context) -> None:
-        """Tắt polling trạng thái base."""
-        ctx.set_polling("base_state", False)
-        super().exit(ctx)
-
 
-@dataclass
 class PickUpEggState(BaseState):
     """Trạng thái nhặt trứng.
 
     Chức năng: Điều khiển tay máy nhặt quả trứng mục tiêu và theo dõi tiến trình.
     Ngữ cảnh: Được kích hoạt khi phát hiện trứng ở vùng phù hợp và base đã dừng.
     """
-    id: str = "PickUpEgg"
-    target: Optional[dict] = None  # expects keys like x_mm, y_mm or convert from pixels
+    __slots__ = ("target",)
 
-    def enter(self, ctx: Context) -> None:
-        """Gửi lệnh nhặt tại (x_mm, y_mm) và bật polling trạng thái arm."""
-        super().enter(ctx)
+    id = "PickUpEgg"
+    SPEC = StateSpec(pollings=(("arm_state", 1.0),))
 
-        scara = getattr(ctx, "scara", {}) or {}
-        height_px = float(scara.get("height_px", 480))
-        width_px = float(scara.get("width_px", 640))
-        height_mm = float(scara.get("height_mm", 240))
-        width_mm = float(scara.get("width_mm", 320))
-        dx = float(scara.get("dx", 100))
-        dy = float(scara.get("width_mm", 50))
+    def __init__(self, target: Optional[dict] = None) -> None:
+        self.target = target  # expects keys like x_mm, y_mm or convert from pixels
+
+    def enter(self, ctx: Context) -> None:
+        """Gửi lệnh nhặt tại (x_mm, y_mm) rồi bật polling trạng thái arm (qua SPEC)."""
+        ctx.logger.debug("Enter: %s", self.id)
+        sx, sy, dx, dy = ctx.scara_affine
 
         x_px = int(self.target.get("x_px", 0) if self.target else 0)
         y_px = int(self.target.get("y_px", 0) if self.target else 0)
 
-        x_mm = int((width_mm / width_px) * x_px + dx)
-        y_mm = int((height_mm / height_px) * y_px + dy)
+        x_mm = int(sx * x_px + dx)
+        y_mm = int(sy * y_px + dy)
 
         ctx.cmd_arm_pick(x_mm, y_mm)
-        ctx.set_polling("arm_state", True, interval_s=1.0)
+        self._apply_spec(ctx)
 
     def handle(self, ctx: Context, event: Event) -> Optional[BaseState]:
-        """Khi arm báo 'done' → quay lại ScanAndMove; nếu 'busy' → tiếp tục chờ."""
+        """Khi arm báo STOPPED (xong) → quay lại ScanAndMove; nếu MOVING (bận) → tiếp tục chờ."""
         if event.type == "arm_state":
             state = event.payload
-            if state == "done":
+            if state is MotionState.STOPPED:
                 return ScanAndMoveState()
         return super().handle(ctx, event)
 
-    def exit(self, ctx: Context) -> None:
-        """Tắt polling trạng thái arm."""
-        ctx.set_polling("arm_state", False)
-        super().exit(ctx)
-
 
 class TurnFirstState(BaseState):
     """Trạng thái quay lần 1 (sau ScanAndMove gặp chướng ngại/không thấy trứng)."""
     id = "TurnFirst"
-
-    def enter(self, ctx: Context) -> None:
-        """Bật polling base_state và đặt timer timeout 10s cho thao tác quay."""
-        super().enter(ctx)
-        ctx.set_polling("base_state", True, interval_s=1.0)
-        ctx.start_timer("turn1_timeout", 10.0)  # Dùng để giả lập tự động
+    # Bật polling base_state và đặt timer timeout 10s cho thao tác quay (dùng để giả lập tự động)
+    SPEC = StateSpec(
+        pollings=(("base_state", 1.0),),
+        timers=((TimerId.TURN1_TIMEOUT, 10.0),),
+    )
 
     def handle(self, ctx: Context, event: Event) -> Optional[BaseState]:
         """Khi base dừng → sang ScanOnly; quá thời gian → cũng sang ScanOnly."""
         if event.type == "base_state":
             state = event.payload
-            if state == "stopped":
+            if state is MotionState.STOPPED:
                 print("Chuyển sang ScanOnly do Base đã dừng")
                 return ScanOnlyState()
-        if event.type == "timer" and event.payload == "turn1_timeout":
+        if event.type == "timer" and event.payload is TimerId.TURN1_TIMEOUT:
             print("Chuyển sang ScanOnly do timeout của TurnFirstState")
             return ScanOnlyState()
         return super().handle(ctx, event)
 
-    def exit(self, ctx: Context) -> None:
-        """Hủy timer và tắt polling base_state."""
-        ctx.cancel_timer("turn1_timeout")
-        ctx.set_polling("base_state", False)
-        super().exit(ctx)
-
 
 class ScanOnlyState(BaseState):
     """Trạng thái chỉ quét (không di chuyển)."""
     id = "ScanOnly"
-
-    def enter(self, ctx: Context) -> None:
-        """Đặt timer 5s: nếu không thấy trứng → chuyển MoveOnly."""
-        super().enter(ctx)
-        ctx.start_timer("no_egg_timeout", 5.0)
+    # Đặt timer 5s: nếu không thấy trứng → chuyển MoveOnly
+    SPEC = StateSpec(timers=((TimerId.NO_EGG_TIMEOUT, 5.0),))
 
     def handle(self, ctx: Context, event: Event) -> Optional[BaseState]:
         """Có trứng → sang PickUpEgg; hết 5s không thấy → sang MoveOnly."""
@@ -266,64 +347,46 @@ class ScanOnlyState(BaseState):
             eggs = event.payload or []
             if eggs:
                 return PickUpEggState(target=eggs[0])
-        if event.type == "timer" and event.payload == "no_egg_timeout":
+        if event.type == "timer" and event.payload is TimerId.NO_EGG_TIMEOUT:
             return MoveOnlyState()
         return super().handle(ctx, event)
 
-    def exit(self, ctx: Context) -> None:
-        """Hủy timer no_egg_timeout."""
-        ctx.cancel_timer("no_egg_timeout")
-        super().exit(ctx)
-
 
 class MoveOnlyState(BaseState):
     """Trạng thái chỉ di chuyển (không quét)."""
     id = "MoveOnly"
-
-    def enter(self, ctx: Context) -> None:
-        """Gửi lệnh tiến và đặt timer 5s; hết thời gian → dừng và quay 90°."""
-        super().enter(ctx)
-        ctx.cmd_base_forward()
-        ctx.start_timer("move_duration", 5.0)
+    # Gửi lệnh tiến và đặt timer 5s; hết thời gian → dừng và quay 90°
+    SPEC = StateSpec(
+        on_enter=(methodcaller("cmd_base_forward"),),
+        timers=((TimerId.MOVE_DURATION, 5.0),),
+    )
 
     def handle(self, ctx: Context, event: Event) -> Optional[BaseState]:
         """Hết 5s → dừng + quay 90° và sang TurnSecond."""
-        if event.type == "timer" and event.payload == "move_duration":
+        if event.type == "timer" and event.payload is TimerId.MOVE_DURATION:
             # ctx.cmd_base_stop() # khi gửi lệnh turn90 thì base thay vì tịnh tiến sẽ xoay luôn, không dừng
             ctx.cmd_base_turn90()
             return TurnSecondState()
         return super().handle(ctx, event)
 
-    def exit(self, ctx: Context) -> None:
-        """Hủy timer move_duration."""
-        ctx.cancel_timer("move_duration")
-        super().exit(ctx)
-
 
 class TurnSecondState(BaseState):
     """Trạng thái quay lần 2 (sau MoveOnly)."""
     id = "TurnSecond"
-
-    def enter(self, ctx: Context) -> None:
-        """Bật polling base_state và đặt timer 10s cho thao tác quay."""
-        super().enter(ctx)
-        ctx.set_polling("base_state", True, interval_s=1.0)
-        ctx.start_timer("turn2_timeout", 10.0)  # Dùng để giả lập tự động
+    # Bật polling base_state và đặt timer 10s cho thao tác quay (dùng để giả lập tự động)
+    SPEC = StateSpec(
+        pollings=(("base_state", 1.0),),
+        timers=((TimerId.TURN2_TIMEOUT, 10.0),),
+    )
 
     def handle(self, ctx: Context, event: Event) -> Optional[BaseState]:
         """Base dừng hoặc quá thời gian → quay lại ScanAndMove."""
         if event.type == "base_state":
             state = event.payload
-            if state == "stopped":
+            if state is MotionState.STOPPED:
                 print("Chuyển sang ScanAndMove do Base đã dừng")
                 return ScanAndMoveState()
-        if event.type == "timer" and event.payload == "turn2_timeout":
+        if event.type == "timer" and event.payload is TimerId.TURN2_TIMEOUT:
             print("Chuyển sang ScanAndMove do timeout của TurnSecondState")
             return ScanAndMoveState()
         return super().handle(ctx, event)
-
-    def exit(self, ctx: Context) -> None:
-        """Hủy timer và tắt polling base_state."""
-        ctx.cancel_timer("turn2_timeout")
-        ctx.set_polling("base_state", False)
-        super().exit(ctx)
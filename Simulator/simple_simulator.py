@@ -2,16 +2,82 @@
 """Simple Serial Simulator - Send and Receive data via COM15."""
 
 import sys
-import serial
-import tkinter as tk
-from tkinter import ttk, scrolledtext
 import threading
+from functools import partial
 import time
 import queue
 from datetime import datetime
 
+FRAME_HEADER = b'$$'
+FRAME_FOOTER = b'##'
+MAX_FRAME_LEN = 64  # quá độ dài này mà chưa thấy footer thì bỏ header, đồng bộ lại
+LOG_PUMP_MS = 20     # chu kỳ đổ log từ hàng đợi lên widget
+LOG_PUMP_IDLE_MS = 100  # chu kỳ khi hàng đợi trống (ít đánh thức vòng Tk khi rảnh)
+LOG_PUMP_BATCH = 200 # số dòng log tối đa mỗi lần đổ
+# Các byte ASCII in được (kèm tab/CR/LF); dùng với bytes.translate để kiểm tra văn bản
+_PRINTABLE = bytes(range(0x20, 0x7F)) + b'\t\n\r'
+
+SRC_ACTOR = 0x05
+SRC_ARM = 0x06
+TYPE_ACK = 0x04
+TYPE_STATE = 0x03
+
+# Bảng tên dùng khi log frame nhận được (dựng một lần, không tạo lại mỗi frame)
+_SRC_NAMES = {SRC_ACTOR: 'ACTOR', SRC_ARM: 'ARM'}
+_TYPE_NAMES = {TYPE_ACK: 'CMD/ACK', TYPE_STATE: 'STATE'}
+_ACTOR_CMD_NAMES = {
+    0x01: 'MOVE_FORWARD',
+    0x02: 'MOVE_BACKWARD',
+    0x03: 'STOP',
+    0x04: 'TURN_90',
+}
+
+
+def _checksum(data: bytes) -> int:
+    """CRC của giao thức: (tổng các byte từ Header đến hết payload) & 0xFF."""
+    return sum(data) & 0xFF
+
+
+def build_frame(source: int, typ: int, payload: bytes) -> bytes:
+    """Dựng frame $$ source type payload CRC ## (CRC tính tự động)."""
+    body = FRAME_HEADER + bytes((source, typ)) + payload
+    return body + bytes((_checksum(body),)) + FRAME_FOOTER
+
+
+# Feedback frames gửi từ simulator (theo docs/protocols.md), dựng sẵn một lần
+_ACTOR_ACK = build_frame(SRC_ACTOR, TYPE_ACK, b'\xFF')
+FRAMES = {
+    "ARM_ACK_PICK": build_frame(SRC_ARM, TYPE_ACK, b'\xFF\xFF'),
+    "ARM_STATE_MOVING": build_frame(SRC_ARM, TYPE_STATE, b'\x01'),
+    "ARM_STATE_IDLE": build_frame(SRC_ARM, TYPE_STATE, b'\x00'),
+    "ACTOR_ACK_MOVE_FORWARD": _ACTOR_ACK,
+    "ACTOR_ACK_MOVE_BACKWARD": _ACTOR_ACK,
+    "ACTOR_ACK_STOP": _ACTOR_ACK,
+    "ACTOR_ACK_TURN": _ACTOR_ACK,
+    "ACTOR_STATE_CLEAR": build_frame(SRC_ACTOR, TYPE_STATE, b'\x01\x64'),     # đang chạy, vật cản 100 cm
+    "ACTOR_STATE_OBSTACLE": build_frame(SRC_ACTOR, TYPE_STATE, b'\x01\x10'),  # đang chạy, vật cản 16 cm
+    "ACTOR_STATE_IDLE": build_frame(SRC_ACTOR, TYPE_STATE, b'\x00\x10'),      # đứng yên, vật cản 16 cm
+}
+
+# pyserial và Tk chỉ import khi dựng GUI, để import module (lấy FRAMES/build_frame) nhẹ
+serial = None
+tk = None
+scrolledtext = None
+
+
+def _lazy_imports():
+    """Import pyserial/tkinter lần đầu cần dùng và gán vào biến toàn cục của module."""
+    global serial, tk, scrolledtext
+    if tk is None:
+        import serial as _serial
+        import tkinter as _tk
+        from tkinter import scrolledtext as _scrolledtext
+        serial, tk, scrolledtext = _serial, _tk, _scrolledtext
+
+
 class SimpleSerialSimulator:
-    def __init__(self):
+    def __init__(self, console_log=False):
+        _lazy_imports()
         self.root = tk.Tk()
         self.root.title("Simple Serial Simulator - COM15 (Send & Receive)")
         self.root.geometry("700x700")
@@ -19,10 +85,17 @@ class SimpleSerialSimulator:
         self.serial_port = None
         self.receiving = False
         self.receive_thread = None
+        self._rx_stop = threading.Event()  # báo receive_loop dừng
+        self._rx_buf = bytearray()  # dữ liệu RX chưa ghép đủ frame
+        self._log_q = queue.SimpleQueue()  # (time_ns, message) chờ ghi lên widget
+        self._log_sec = None  # giây của timestamp gần nhất đã format
+        self._log_hms = ""    # chuỗi "%H:%M:%S" tương ứng _log_sec
+        self._console_log = console_log  # in thêm log ra console (chậm trên Windows)
         self.send_queue = queue.Queue()
         self._send_thread = threading.Thread(target=self.send_loop, daemon=True)
         self._send_thread.start()
         self.setup_ui()
+        self.root.after(LOG_PUMP_MS, self._pump_log)
         
     def setup_ui(self):
         """Create simple UI with buttons and log."""
@@ -49,9 +122,9 @@ class SimpleSerialSimulator:
         arm_frame = tk.LabelFrame(control_frame, text="ARM", padx=5, pady=5)
         arm_frame.pack(fill="x", pady=5)
         
-        tk.Button(arm_frame, text="ACK pick-up", command=lambda: self.send_data("ARM_ACK_PICK", b'\x24\x24\x06\x04\xFF\xFF\x50\x23\x23')).pack(side=tk.LEFT, padx=5)
-        tk.Button(arm_frame, text="ACK state (moving)", command=lambda: self.send_data("ARM_STATE_MOVING", b'\x24\x24\x06\x03\x01\x52\x23\x23')).pack(side=tk.LEFT, padx=5)
-        tk.Button(arm_frame, text="ACK state (idle)", command=lambda: self.send_data("ARM_STATE_IDLE", b'\x24\x24\x06\x03\x00\x51\x23\x23')).pack(side=tk.LEFT, padx=5)
+        tk.Button(arm_frame, text="ACK pick-up", command=self._frame_sender("ARM_ACK_PICK")).pack(side=tk.LEFT, padx=5)
+        tk.Button(arm_frame, text="ACK state (moving)", command=self._frame_sender("ARM_STATE_MOVING")).pack(side=tk.LEFT, padx=5)
+        tk.Button(arm_frame, text="ACK state (idle)", command=self._frame_sender("ARM_STATE_IDLE")).pack(side=tk.LEFT, padx=5)
         
         # ACTOR buttons
         actor_frame = tk.LabelFrame(control_frame, text="ACTOR", padx=5, pady=5)
@@ -59,17 +132,17 @@ class SimpleSerialSimulator:
         
         actor_cmd_row = tk.Frame(actor_frame)
         actor_cmd_row.pack(fill="x", pady=5)
-        tk.Button(actor_cmd_row, text="ACK move forward", command=lambda: self.send_data("ACTOR_ACK_MOVE_FORWARD", b'\x24\x24\x05\x04\xFF\x50\x23\x23')).pack(side=tk.LEFT, padx=5)
-        tk.Button(actor_cmd_row, text="ACK move backward", command=lambda: self.send_data("ACTOR_ACK_MOVE_BACKWARD", b'\x24\x24\x05\x04\xFF\x50\x23\x23')).pack(side=tk.LEFT, padx=5)
-        tk.Button(actor_cmd_row, text="ACK stop", command=lambda: self.send_data("ACTOR_ACK_STOP", b'\x24\x24\x05\x04\xFF\x50\x23\x23')).pack(side=tk.LEFT, padx=5)
-        tk.Button(actor_cmd_row, text="ACK turn 90", command=lambda: self.send_data("ACTOR_ACK_TURN", b'\x24\x24\x05\x04\xFF\x50\x23\x23')).pack(side=tk.LEFT, padx=5)
+        tk.Button(actor_cmd_row, text="ACK move forward", command=self._frame_sender("ACTOR_ACK_MOVE_FORWARD")).pack(side=tk.LEFT, padx=5)
+        tk.Button(actor_cmd_row, text="ACK move backward", command=self._frame_sender("ACTOR_ACK_MOVE_BACKWARD")).pack(side=tk.LEFT, padx=5)
+        tk.Button(actor_cmd_row, text="ACK stop", command=self._frame_sender("ACTOR_ACK_STOP")).pack(side=tk.LEFT, padx=5)
+        tk.Button(actor_cmd_row, text="ACK turn 90", command=self._frame_sender("ACTOR_ACK_TURN")).pack(side=tk.LEFT, padx=5)
         
         actor_state_row = tk.Frame(actor_frame)
         actor_state_row.pack(fill="x", pady=5)
-        tk.Button(actor_state_row, text="ACK state (no obstacle)", command=lambda: self.send_data("ACTOR_STATE_CLEAR", b'\x24\x24\x05\x03\x01\x64\xB5\x23\x23')).pack(side=tk.LEFT, padx=5)
-        tk.Button(actor_state_row, text="ACK state (get obstacle)", command=lambda: self.send_data("ACTOR_STATE_OBSTACLE", b'\x24\x24\x05\x03\x01\x10\x61\x23\x23')).pack(side=tk.LEFT, padx=5)
+        tk.Button(actor_state_row, text="ACK state (no obstacle)", command=self._frame_sender("ACTOR_STATE_CLEAR")).pack(side=tk.LEFT, padx=5)
+        tk.Button(actor_state_row, text="ACK state (get obstacle)", command=self._frame_sender("ACTOR_STATE_OBSTACLE")).pack(side=tk.LEFT, padx=5)
         # Theo yêu cầu: nút ACK state (idle) của ACTOR, với payload đã chỉ định
-        tk.Button(actor_state_row, text="ACK state (idle)", command=lambda: self.send_data("ACTOR_STATE_IDLE", b'\x24\x24\x05\x03\x00\x10\x60\x23\x23')).pack(side=tk.LEFT, padx=5)
+        tk.Button(actor_state_row, text="ACK state (idle)", command=self._frame_sender("ACTOR_STATE_IDLE")).pack(side=tk.LEFT, padx=5)
         
         # Custom send frame
         custom_frame = tk.LabelFrame(self.root, text="Custom Command", padx=5, pady=5)
@@ -87,6 +160,11 @@ class SimpleSerialSimulator:
         
         self.log_text = scrolledtext.ScrolledText(log_frame, height=12, width=80)
         self.log_text.pack(fill="both", expand=True)
+        # Color coding for different message types (configured once)
+        self.log_text.tag_config("tx", foreground="blue")
+        self.log_text.tag_config("rx", foreground="green")
+        self.log_text.tag_config("error", foreground="red")
+        self.log_text.tag_config("success", foreground="darkgreen")
         
         # Log control buttons
         log_btn_frame = tk.Frame(log_frame)
@@ -95,32 +173,61 @@ class SimpleSerialSimulator:
         tk.Button(log_btn_frame, text="Save Log", command=self.save_log).pack(side=tk.LEFT, padx=5)
         
     def log(self, message, color="black"):
-        """Add message to log with timestamp and color."""
-        if threading.current_thread() is not threading.main_thread():
-            self.root.after(0, self.log, message, color)
-            return
+        """Queue message for the log area; safe to call from any thread.
 
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        log_msg = f"[{timestamp}] {message}\n"
-        
-        self.log_text.insert(tk.END, log_msg)
-        
-        # Color coding for different message types
+        Tk widgets are only touched by _pump_log on the Tk thread.
+        """
+        self._log_q.put((time.time_ns(), message))
+
+    def _pump_log(self):
+        """Drain queued log messages onto the widget, then reschedule itself.
+
+        The whole batch goes in with a single Text.insert call, passing
+        alternating (text, tag) pairs so each line keeps its color. The view
+        only follows the new lines when it was already scrolled to the bottom.
+        While the queue stays empty the pump backs off to LOG_PUMP_IDLE_MS.
+        """
+        chunks = []
+        for _ in range(LOG_PUMP_BATCH):
+            try:
+                ts, message = self._log_q.get_nowait()
+            except queue.Empty:
+                break
+            log_msg = f"[{self._format_ts(ts)}] {message}\n"
+            chunks += (log_msg, self._log_tag(message))
+            if self._console_log:
+                print(log_msg, end='')  # Also print to console
+        if chunks:
+            at_bottom = self.log_text.yview()[1] >= 1.0
+            self.log_text.insert(tk.END, *chunks)
+            if at_bottom:
+                self.log_text.see(tk.END)
+        self.root.after(LOG_PUMP_MS if chunks else LOG_PUMP_IDLE_MS, self._pump_log)
+
+    def _format_ts(self, ns):
+        """Format an epoch-ns timestamp as HH:MM:SS.mmm.
+
+        strftime only runs when the second changes; the milliseconds are
+        appended from the integer remainder.
+        """
+        sec, rem = divmod(ns, 1_000_000_000)
+        if sec != self._log_sec:
+            self._log_sec = sec
+            self._log_hms = time.strftime("%H:%M:%S", time.localtime(sec))
+        return f"{self._log_hms}.{rem // 1_000_000:03d}"
+
+    @staticmethod
+    def _log_tag(message):
+        """Return the color tag for a log message (tags are set up in setup_ui)."""
         if "📤 TX" in message:
-            self.log_text.tag_add("tx", f"end-2l", f"end-1l")
-            self.log_text.tag_config("tx", foreground="blue")
-        elif "📥 RX" in message:
-            self.log_text.tag_add("rx", f"end-2l", f"end-1l")
-            self.log_text.tag_config("rx", foreground="green")
-        elif "❌" in message:
-            self.log_text.tag_add("error", f"end-2l", f"end-1l")
-            self.log_text.tag_config("error", foreground="red")
-        elif "✅" in message:
-            self.log_text.tag_add("success", f"end-2l", f"end-1l")
-            self.log_text.tag_config("success", foreground="darkgreen")
-        
-        self.log_text.see(tk.END)
-        print(log_msg.strip())  # Also print to console
+            return "tx"
+        if "📥 RX" in message:
+            return "rx"
+        if "❌" in message:
+            return "error"
+        if "✅" in message:
+            return "success"
+        return ()
         
     def clear_log(self):
         """Clear the log area."""
@@ -146,7 +253,7 @@ class SimpleSerialSimulator:
             self.serial_port = serial.Serial(
                 port='COM15',
                 baudrate=115200,
-                timeout=1.0
+                timeout=0.1  # read() chặn tối đa 100 ms để receive_loop kịp thấy lệnh dừng
             )
             
             self.status_label.config(text="Connected to COM15", fg="green")
@@ -179,6 +286,8 @@ class SimpleSerialSimulator:
         """Start receiving data in background thread."""
         if not self.receiving:
             self.receiving = True
+            self._rx_buf.clear()
+            self._rx_stop = threading.Event()  # Event mới cho mỗi thread nhận
             self.receive_thread = threading.Thread(target=self.receive_loop, daemon=True)
             self.receive_thread.start()
             self.receive_label.config(text="Receiving Data", fg="green")
@@ -187,85 +296,123 @@ class SimpleSerialSimulator:
     def stop_receiving(self):
         """Stop receiving data."""
         self.receiving = False
+        self._rx_stop.set()
+        # đánh thức read() đang chặn thay vì chờ hết timeout của port
+        port = self.serial_port
+        if port and port.is_open:
+            try:
+                port.cancel_read()
+            except Exception:
+                pass
         self.receive_label.config(text="Not Receiving", fg="orange")
         if self.receive_thread:
-            self.receive_thread.join(timeout=1)
+            self.receive_thread.join(timeout=0.2)
     
     def receive_loop(self):
-        """Background thread to receive data from COM15."""
-        while self.receiving and self.serial_port and self.serial_port.is_open:
+        """Background thread to receive data from COM15.
+
+        read(1) blocks until the first byte arrives (or the port timeout expires),
+        then everything already buffered is drained in one read. stop_receiving
+        sets the stop Event and cancels the pending read so the loop exits at once.
+        """
+        port = self.serial_port
+        stop = self._rx_stop
+        while not stop.is_set() and port and port.is_open:
             try:
-                if self.serial_port.in_waiting > 0:
-                    data = self.serial_port.read(self.serial_port.in_waiting)
-                    self.process_received_data(data)
-                time.sleep(0.01)  # Small delay to prevent high CPU usage
-                
+                data = port.read(1)
+                if not data:
+                    continue
+                data += port.read(port.in_waiting)
+                self.process_received_data(data)
+
             except Exception as e:
-                self.log(f"❌ Receive error: {e}")
+                if not stop.is_set():
+                    self.log(f"❌ Receive error: {e}")
                 break
 
     def send_loop(self):
-        """Background thread to transmit queued frames without blocking the UI."""
-        while True:
+        """Background thread to transmit queued frames without blocking the UI.
+
+        Frames queued while the previous write was in progress (e.g. several
+        button clicks in a row) are coalesced into a single write call.
+        """
+        running = True
+        while running:
             item = self.send_queue.get()
             if item is None:
                 break
-            event_name, data = item
+            batch = [item]
+            while True:
+                try:
+                    item = self.send_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+
+            names = ", ".join(event_name for event_name, _ in batch)
             if not self.serial_port or not self.serial_port.is_open:
-                self.log(f"❌ Send aborted [{event_name}]: COM15 not connected")
+                self.log(f"❌ Send aborted [{names}]: COM15 not connected")
                 continue
             try:
-                bytes_written = self.serial_port.write(data)
-                hex_data = ' '.join(f'{b:02X}' for b in data)
-                self.log(f"📤 TX [{event_name}]: {hex_data} ({bytes_written} bytes)")
+                self.serial_port.write(b"".join(data for _, data in batch))
+                for event_name, data in batch:
+                    hex_data = data.hex(' ').upper()
+                    self.log(f"📤 TX [{event_name}]: {hex_data} ({len(data)} bytes)")
             except serial.SerialException as e:
-                self.log(f"❌ Send error [{event_name}]: {e}")
+                self.log(f"❌ Send error [{names}]: {e}")
             except Exception as e:
-                self.log(f"❌ Unexpected send error [{event_name}]: {e}")
+                self.log(f"❌ Unexpected send error [{names}]: {e}")
 
     def process_received_data(self, data):
         """Process and display received data."""
-        hex_data = ' '.join(f'{b:02X}' for b in data)
+        hex_data = data.hex(' ').upper()
         self.log(f"📥 RX: {hex_data} ({len(data)} bytes)")
 
-        # Tách và parse từng frame theo giao thức $$ ... ##
-        for frame in self._iter_frames(data):
+        # Ghép vào buffer, tách và parse từng frame theo giao thức $$ ... ##
+        self._rx_buf += data
+        for frame in self._pop_frames():
             self.parse_protocol_frame(frame)
 
-        # Thử decode ASCII (không ảnh hưởng đến giao thức)
-        try:
-            text = data.decode('utf-8', errors='ignore').strip()
-            if text and all(c.isprintable() or c.isspace() for c in text):
+        # Thử decode ASCII (không ảnh hưởng đến giao thức): bỏ qua khi là frame '$$...',
+        # còn lại chỉ decode khi mọi byte đều in được
+        if not data.startswith(FRAME_HEADER) and not data.translate(None, _PRINTABLE):
+            text = data.decode('ascii').strip()
+            if text:
                 self.log(f"📝 ASCII: '{text}'")
-        except Exception:
-            pass
-
-    def _iter_frames(self, data: bytes):
-        """Yield all protocol frames delimited by header '$$' and footer '##'."""
-        i = 0
-        n = len(data)
-        while i + 3 < n:
-            # tìm header
-            if i + 1 < n and data[i] == 0x24 and data[i + 1] == 0x24:
-                # tìm footer tiếp theo
-                j = i + 2
-                while j + 1 < n:
-                    if data[j] == 0x23 and data[j + 1] == 0x23:
-                        yield data[i : j + 2]
-                        i = j + 2
-                        break
-                    j += 1
-                else:
-                    # không tìm thấy footer, dừng
-                    break
-            else:
-                i += 1
+
+    def _pop_frames(self):
+        """Yield complete frames from the RX buffer, keeping a trailing partial frame.
+
+        Frames may arrive split across reads, so bytes stay in self._rx_buf until
+        their footer shows up. Noise before a header is dropped, and a header that
+        has no footer within MAX_FRAME_LEN bytes is skipped to resync.
+        """
+        buf = self._rx_buf
+        while True:
+            start = buf.find(FRAME_HEADER)
+            if start < 0:
+                # Giữ lại '$' cuối vì có thể là nửa đầu của header
+                del buf[:-1 if buf.endswith(FRAME_HEADER[:1]) else len(buf)]
+                return
+            del buf[:start]
+            end = buf.find(FRAME_FOOTER, len(FRAME_HEADER), MAX_FRAME_LEN)
+            if end < 0:
+                if len(buf) >= MAX_FRAME_LEN:
+                    del buf[:1]
+                    continue
+                return
+            end += len(FRAME_FOOTER)
+            frame = bytes(buf[:end])
+            del buf[:end]
+            yield frame
 
     def _crc_ok(self, frame: bytes) -> bool:
         if len(frame) < 5:
             return False
-        calc = sum(frame[:-3]) & 0xFF
-        return calc == frame[-3]
+        return _checksum(frame[:-3]) == frame[-3]
 
     def parse_protocol_frame(self, frame: bytes):
         """Parse protocol frame and show details (theo docs/protocols.md)."""
@@ -280,20 +427,14 @@ class SimpleSerialSimulator:
             footer = frame[-2:]
             crc_ok = self._crc_ok(frame)
 
-            src_name = {0x05: 'ACTOR', 0x06: 'ARM'}.get(src, f'0x{src:02X}')
-            typ_name = {0x04: 'CMD/ACK', 0x03: 'STATE'}.get(typ, f'0x{typ:02X}')
+            src_name = _SRC_NAMES.get(src) or f'0x{src:02X}'
+            typ_name = _TYPE_NAMES.get(typ) or f'0x{typ:02X}'
             self.log(f"📋 Frame: src={src_name}, type={typ_name}, payload={payload.hex().upper()}, CRC=0x{crc:02X} ({'OK' if crc_ok else 'BAD'}), footer={footer.hex().upper()}")
 
             # Giải mã lệnh PC -> Actor
             if src == 0x05 and typ == 0x04 and len(payload) >= 1:
                 cmd = payload[0]
-                cmd_map = {
-                    0x01: 'MOVE_FORWARD',
-                    0x02: 'MOVE_BACKWARD',
-                    0x03: 'STOP',
-                    0x04: 'TURN_90',
-                }
-                name = cmd_map.get(cmd, f'UNKNOWN_0x{cmd:02X}')
+                name = _ACTOR_CMD_NAMES.get(cmd) or f'UNKNOWN_0x{cmd:02X}'
                 self.log(f"🎯 PC→Actor Command: {name}")
 
             # Giải mã đọc trạng thái 1 PC -> Actor
@@ -322,6 +463,10 @@ class SimpleSerialSimulator:
         # Push send request to background thread to avoid blocking the UI
         self.send_queue.put((event_name, bytes(data)))
     
+    def _frame_sender(self, name):
+        """Callback cho nút: gửi frame dựng sẵn FRAMES[name] (partial, không tạo closure)."""
+        return partial(self.send_data, name, FRAMES[name])
+
     def send_custom_hex(self):
         """Send custom hex data."""
         try:
@@ -361,9 +506,10 @@ if __name__ == "__main__":
     print("- Receive and display incoming data")
     print("- Parse protocol frames")
     print("- Color-coded logs")
+    print("- Pass -v to also print the log to this console")
     
     try:
-        simulator = SimpleSerialSimulator()
+        simulator = SimpleSerialSimulator(console_log="-v" in sys.argv[1:])
         simulator.run()
     except KeyboardInterrupt:
         print("\n🛑 Simulator stopped by user")